@@ -0,0 +1,58 @@
+// Long-lived snarkjs process used by zk-rsa-verifier.py
+//
+// Reads one JSON command per line on stdin:
+//   {"section": "groth16", "op": "prove", "args": [...]}
+// and answers each with one JSON line on stdout:
+//   {"ok": true, "result": ...} or {"ok": false, "error": "..."}
+//
+// An argument of the form {"$ref": name} is replaced by a value
+// previously kept with {"store": name, "value": ...}.
+
+// stdout carries only replies; send anything snarkjs or its dependencies
+// print to stderr, where it cannot be mistaken for one
+console.log = console.info = console.debug = console.warn = console.error;
+
+const readline = require("readline");
+const snarkjs = require("snarkjs");
+
+const stored = {};
+
+function resolveArg(arg) {
+    if (arg !== null && typeof arg === "object") {
+        if ("$ref" in arg) return stored[arg.$ref];
+    }
+    return arg;
+}
+
+function reply(message) {
+    const line = JSON.stringify(message, (key, value) =>
+        typeof value === "bigint" ? value.toString() : value);
+    process.stdout.write(line + "\n");
+}
+
+async function main() {
+    const rl = readline.createInterface({ input: process.stdin });
+
+    for await (const line of rl) {
+        if (!line.trim()) continue;
+
+        try {
+            const { section, op, args, store, value } = JSON.parse(line);
+            if (store !== undefined) {
+                stored[store] = value;
+                reply({ ok: true, result: null });
+                continue;
+            }
+
+            const result = await snarkjs[section][op](...(args || []).map(resolveArg));
+            reply({ ok: true, result: result === undefined ? null : result });
+        } catch (err) {
+            reply({ ok: false, error: String((err && err.message) || err) });
+        }
+    }
+
+    // snarkjs keeps curve worker threads alive, so exit explicitly
+    process.exit(0);
+}
+
+main();
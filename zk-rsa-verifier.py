@@ -1,28 +1,152 @@
 import os
 import json
+import hashlib
+import math
+import shutil
 import subprocess
+import sys
+import tempfile
 import time
 from pathlib import Path
+import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+# Node.js helper that keeps snarkjs loaded between calls
+SNARKJS_WORKER = Path(__file__).with_name("snarkjs_worker.js")
+
+# Small primes used to short-circuit the Miller-Rabin test
+SMALL_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61)
+SIEVE_LIMIT = 1 << 16
+
+# Published BLAKE2b-512 digest of powersOfTau28_hez_final_14.ptau
+# (snarkjs README, "Prepare phase 2")
+PTAU_BLAKE2B = (
+    "eeefbcf7c3803b523c94112023c7ff89558f9b8e0cf5d6cdcba3ade60f168af4"
+    "a181c9c21774b94fbae6c90411995f7d854d02ebd93fb66043dbb06f17a831c1"
+)
 
 class ZKRSAVerifier:
     def __init__(self, bit_length=16):
         self.bit_length = bit_length
         self.min_value = 2**(bit_length - 1)  # 32768
         self.max_value = 2**bit_length - 1    # 65535
+        self._sieve = None
+        self.circuits = Path("circuits").absolute()
+        self.build = Path("build").absolute()
+        self.proofs = Path("proofs").absolute()
+        
+        # Per-proof intermediates (inputs, witnesses, proofs) live in RAM
+        # on Linux; compiled artifacts stay in build/ across runs
+        shm = Path("/dev/shm")
+        self._scratch_dir = tempfile.TemporaryDirectory(
+            prefix="zkrsa-",
+            dir=shm if sys.platform == "linux" and shm.is_dir() else None
+        )
+        self.scratch = Path(self._scratch_dir.name)
+        
+        # Native prover and witness generator, used when installed
+        self._rapidsnark = shutil.which("rapidsnark") or shutil.which("prover")
+        self._witnesscalc = shutil.which("witnesscalc_rsa_verifier")
         
         print("="*60)
         print(f"ZK-RSA Setup Verifier ({bit_length}-bit primes)")
         print("="*60)
         
-        self.setup_project()
+        self._start_snarkjs_worker()
+        try:
+            self.setup_project()
+            self._load_verification_key()
+        except BaseException:
+            self.close()
+            raise
+    
+    def close(self):
+        """Stop the snarkjs worker and remove the scratch directory"""
+        try:
+            if not self._node.stdin.closed:
+                try:
+                    self._node.stdin.close()
+                except BrokenPipeError:
+                    pass
+                try:
+                    self._node.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self._node.kill()
+                    self._node.wait()
+                self._node.stdout.close()
+        finally:
+            self._scratch_dir.cleanup()
+    
+    def _start_snarkjs_worker(self):
+        """Start a persistent Node.js process with snarkjs loaded"""
+        env = dict(os.environ)
+        
+        # Let require('snarkjs') find a global `npm install -g snarkjs`
+        npm = shutil.which("npm")
+        if npm:
+            npm_root = subprocess.run(
+                [npm, "root", "-g"],
+                capture_output=True,
+                text=True
+            ).stdout.strip()
+            env["NODE_PATH"] = os.pathsep.join(filter(None, [env.get("NODE_PATH"), npm_root]))
+        
+        self._node = subprocess.Popen(
+            ["node", str(SNARKJS_WORKER)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            env=env
+        )
+    
+    def _snarkjs(self, section, op, *args):
+        """Call snarkjs.<section>.<op>(*args) in the worker process"""
+        command = {"section": section, "op": op, "args": list(args)}
+        return self._send_to_worker(command, f"snarkjs {section}.{op}")
+    
+    def _snarkjs_store(self, name, value):
+        """Keep a value in the worker, to be passed later as {"$ref": name}"""
+        self._send_to_worker({"store": name, "value": value}, f"storing {name}")
+    
+    def _send_to_worker(self, command, description):
+        """Send one command to the worker and return its result"""
+        try:
+            self._node.stdin.write(json.dumps(command) + "\n")
+            self._node.stdin.flush()
+            line = self._node.stdout.readline()
+        except OSError:
+            line = ""
+        
+        if not line:
+            # stdout is closed, so the worker is on its way out
+            try:
+                code = self._node.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                code = None
+            raise Exception(f"snarkjs worker exited unexpectedly (exit code {code})")
+        
+        reply = json.loads(line)
+        if not reply["ok"]:
+            raise Exception(f"{description} failed: {reply['error']}")
+        return reply["result"]
     
     def setup_project(self):
         """Setup project structure"""
         # Create directories
-        Path("circuits").mkdir(exist_ok=True)
-        Path("build").mkdir(exist_ok=True)
-        Path("proofs").mkdir(exist_ok=True)
+        self.circuits.mkdir(exist_ok=True)
+        self.build.mkdir(exist_ok=True)
+        self.proofs.mkdir(exist_ok=True)
         
         print("✓ Project directories created")
         
@@ -44,34 +168,60 @@ class ZKRSAVerifier:
         # 1. Main RSA verifier circuit
         main_circuit = f"""pragma circom 2.1.0;
 
-template ModulusCheck(n) {{
+function nbits(a) {{
+    var n = 1;
+    var r = 0;
+    while (n - 1 < a) {{
+        r++;
+        n *= 2;
+    }}
+    return r;
+}}
+
+// Inverse of a modulo m, or 0 if gcd(a, m) != 1
+function modInverse(a, m) {{
+    var t = 0;
+    var newT = 1;
+    var r = m;
+    var newR = a % m;
+    var q;
+    var tmp;
+    while (newR != 0) {{
+        q = r \\ newR;
+        tmp = newT;
+        newT = (t + m - (q * newT) % m) % m;
+        t = tmp;
+        tmp = newR;
+        newR = r - q * newR;
+        r = tmp;
+    }}
+    return r == 1 ? t : 0;
+}}
+
+// Checks gcd(value, m) == 1 for an n-bit value and a constant modulus m.
+// Instances are independent, so the C++ witness generator runs them in parallel
+template parallel CoprimeCheck(n, m) {{
     signal input value;
-    signal input modulus;
-    signal output isNotDivisible;
+    signal output isCoprime;
     
+    signal inverse;
     signal quotient;
-    signal remainder;
     
-    quotient <-- value \\ modulus;
-    remainder <-- value % modulus;
+    inverse <-- modInverse(value, m);
+    isCoprime <-- inverse != 0 ? 1 : 0;
+    quotient <-- (value * inverse - isCoprime) \\ m;
     
-    // Ensure valid division
-    value === quotient * modulus + remainder;
+    isCoprime * (isCoprime - 1) === 0;
     
-    // Check remainder != 0
-    component isZero = IsZero();
-    isZero.in <== remainder;
-    isNotDivisible <== 1 - isZero.out;
-}}
-
-template IsZero() {{
-    signal input in;
-    signal output out;
+    // Range checks keep both sides below the field size, so this holds
+    // over the integers: value * inverse = 1 + quotient * m
+    component inverseBits = Num2Bits(nbits(m));
+    inverseBits.in <== inverse;
     
-    signal inv;
-    inv <-- in != 0 ? 1/in : 0;
-    out <== -in * inv + 1;
-    in * out === 0;
+    component quotientBits = Num2Bits(n);
+    quotientBits.in <== quotient;
+    
+    value * inverse === isCoprime + quotient * m;
 }}
 
 template SimplePrimalityTest() {{
@@ -79,29 +229,59 @@ template SimplePrimalityTest() {{
     signal output isPrime;
     
     // Check divisibility by small primes
-    signal checks[54];  // Number of primes up to 256
+    signal checks[2];
     
     // List of primes to check
     var primes[54] = [2,3,5,7,11,13,17,19,23,29,31,37,41,43,47,53,59,61,67,71,73,79,83,89,97,101,103,107,109,113,127,131,137,139,149,151,157,163,167,173,179,181,191,193,197,199,211,223,227,229,233,239,241,251];
     
-    component modChecks[54];
-    
+    // The primorial is ~335 bits, so split it into two products that
+    // each fit in a field element (~170 bits each)
+    var products[2] = [1, 1];
     for (var i = 0; i < 54; i++) {{
-        modChecks[i] = ModulusCheck(20);  // 20 bits is enough
+        products[i % 2] *= primes[i];
+    }}
+    
+    component modChecks[2];
+    
+    for (var i = 0; i < 2; i++) {{
+        modChecks[i] = CoprimeCheck({self.bit_length}, products[i]);
         modChecks[i].value <== n;
-        modChecks[i].modulus <== primes[i];
-        checks[i] <== modChecks[i].isNotDivisible;
+        checks[i] <== modChecks[i].isCoprime;
     }}
     
     // All checks must pass
-    signal accumulated[54];
-    accumulated[0] <== checks[0];
-    
-    for (var i = 1; i < 54; i++) {{
-        accumulated[i] <== accumulated[i-1] * checks[i];
+    component allChecks = ProductTree(2);
+    for (var i = 0; i < 2; i++) {{
+        allChecks.in[i] <== checks[i];
     }}
     
-    isPrime <== accumulated[53];
+    isPrime <== allChecks.out;
+}}
+
+// Product of n signals as a balanced tree of depth ceil(log2(n))
+template ProductTree(n) {{
+    signal input in[n];
+    signal output out;
+    
+    var half = n \\ 2;
+    component left;
+    component right;
+    
+    if (n == 1) {{
+        out <== in[0];
+    }} else if (n == 2) {{
+        out <== in[0] * in[1];
+    }} else {{
+        left = ProductTree(half);
+        right = ProductTree(n - half);
+        for (var i = 0; i < half; i++) {{
+            left.in[i] <== in[i];
+        }}
+        for (var i = half; i < n; i++) {{
+            right.in[i - half] <== in[i];
+        }}
+        out <== left.out * right.out;
+    }}
 }}
 
 template RSASetupVerifier() {{
@@ -112,87 +292,40 @@ template RSASetupVerifier() {{
     // Calculate n = p * q
     n <== p * q;
     
-    // Range checks
+    // Range checks: a {self.bit_length}-bit decomposition bounds p from above,
+    // and its top bit being set bounds it from below
     signal validP;
     signal validQ;
     
-    // Check p is in range [32768, 65535]
-    component geP = GreaterEqThan(16);
-    geP.in[0] <== p;
-    geP.in[1] <== {self.min_value};
-    
-    component leP = LessEqThan(16);
-    leP.in[0] <== p;
-    leP.in[1] <== {self.max_value};
-    
-    validP <== geP.out * leP.out;
-    
-    // Check q is in range [32768, 65535]
-    component geQ = GreaterEqThan(16);
-    geQ.in[0] <== q;
-    geQ.in[1] <== {self.min_value};
+    // Check p is in range [{self.min_value}, {self.max_value}]
+    component pBits = Num2Bits({self.bit_length});
+    pBits.in <== p;
+    validP <== pBits.out[{self.bit_length - 1}];
     
-    component leQ = LessEqThan(16);
-    leQ.in[0] <== q;
-    leQ.in[1] <== {self.max_value};
+    // Check q is in range [{self.min_value}, {self.max_value}]
+    component qBits = Num2Bits({self.bit_length});
+    qBits.in <== q;
+    validQ <== qBits.out[{self.bit_length - 1}];
     
-    validQ <== geQ.out * leQ.out;
+    // Check p != q: p - q has an inverse only when it is non-zero
+    signal diffInv;
+    diffInv <-- p != q ? 1 / (p - q) : 0;
+    (p - q) * diffInv === 1;
     
-    // Check p != q
-    component eq = IsEqual();
-    eq.in[0] <== p;
-    eq.in[1] <== q;
-    signal different <== 1 - eq.out;
-    
-    // Primality tests
-    component primeP = SimplePrimalityTest();
+    // Primality tests, computed concurrently by the C++ witness generator
+    component primeP = parallel SimplePrimalityTest();
     primeP.n <== p;
     
-    component primeQ = SimplePrimalityTest();
+    component primeQ = parallel SimplePrimalityTest();
     primeQ.n <== q;
     
     // All conditions must be true
-    signal valid <== validP * validQ * different * primeP.isPrime * primeQ.isPrime;
-    valid === 1;
-}}
-
-// Comparison templates
-template GreaterEqThan(n) {{
-    signal input in[2];
-    signal output out;
-    
-    component lt = LessThan(n);
-    lt.in[0] <== in[0];
-    lt.in[1] <== in[1];
-    out <== 1 - lt.out;
-}}
-
-template LessEqThan(n) {{
-    signal input in[2];
-    signal output out;
-    
-    component lt = LessThan(n);
-    lt.in[0] <== in[1];
-    lt.in[1] <== in[0];
-    out <== 1 - lt.out;
-}}
-
-template LessThan(n) {{
-    signal input in[2];
-    signal output out;
-    
-    component n2b = Num2Bits(n+1);
-    n2b.in <== in[0] + (1<<n) - in[1];
-    out <== 1 - n2b.out[n];
-}}
-
-template IsEqual() {{
-    signal input in[2];
-    signal output out;
-    
-    component isz = IsZero();
-    isz.in <== in[0] - in[1];
-    out <== isz.out;
+    component valid = ProductTree(4);
+    valid.in[0] <== validP;
+    valid.in[1] <== validQ;
+    valid.in[2] <== primeP.isPrime;
+    valid.in[3] <== primeQ.isPrime;
+    valid.out === 1;
 }}
 
 template Num2Bits(n) {{
@@ -228,26 +361,31 @@ component main = RSASetupVerifier();
 """
         
         # Save circuit
-        with open("circuits/rsa_verifier.circom", "w") as f:
+        with open(self.circuits / "rsa_verifier.circom", "w") as f:
             f.write(main_circuit)
         
         print("✓ Circuit files created")
     
     def download_ptau(self):
         """Download Powers of Tau file"""
-        ptau_path = Path("build/pot14_final.ptau")
+        ptau_path = self.build / "pot14_final.ptau"
         
+        # Cached, resumed and hand-placed files are all checked against the
+        # published digest, so a truncated or tampered file never reaches setup
         if ptau_path.exists():
-            print("✓ Powers of Tau file already exists")
-            return
+            if self._blake2b(ptau_path).hexdigest() == PTAU_BLAKE2B:
+                print("✓ Powers of Tau file already exists")
+                return
+            
+            print("⚠️  Powers of Tau file does not match its published digest, downloading again")
+            ptau_path.unlink()
         
         print("Downloading Powers of Tau file...")
         
         # Alternative download sources
         urls = [
             "https://hermez.s3-eu-west-1.amazonaws.com/powersOfTau28_hez_final_14.ptau",
-            "https://storage.googleapis.com/zkevm/ptau/powersOfTau28_hez_final_14.ptau",
-            "https://github.com/iden3/snarkjs/raw/master/build/powersOfTau12_final.ptau"
+            "https://storage.googleapis.com/zkevm/ptau/powersOfTau28_hez_final_14.ptau"
         ]
         
         # Try each URL
@@ -257,17 +395,60 @@ component main = RSASetupVerifier();
                 
                 # Add headers to avoid 403
                 import urllib.request
-                request = urllib.request.Request(
-                    url,
-                    headers={
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                )
+                headers = {
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                }
+                
+                # Partial downloads are named after the remote file, so
+                # mirrors of the same file can resume each other's progress
+                part_path = ptau_path.with_name(url.rsplit('/', 1)[1] + ".part")
+                offset = part_path.stat().st_size if part_path.exists() else 0
+                if offset:
+                    headers['Range'] = f"bytes={offset}-"
+                    print(f"  Resuming from {offset} bytes...")
+                
+                request = urllib.request.Request(url, headers=headers)
+                
+                try:
+                    response = urllib.request.urlopen(request)
+                except urllib.error.HTTPError as e:
+                    # 416 means the part file already holds the whole remote
+                    # file: finish it if it checks out, otherwise start over
+                    if e.code != 416 or not offset:
+                        raise
+                    if self._blake2b(part_path).hexdigest() != PTAU_BLAKE2B:
+                        part_path.unlink()
+                        raise Exception("Partial download does not match its published digest")
+                    part_path.replace(ptau_path)
+                    print("✓ Downloaded Powers of Tau file")
+                    return
+                
+                with response:
+                    # Server ignored the Range header, start over
+                    if response.status != 206:
+                        offset = 0
+                    expected = response.headers.get('Content-Length')
+                    
+                    # Hash while streaming, starting from any resumed prefix
+                    h = self._blake2b(part_path) if offset else hashlib.blake2b()
+                    
+                    with open(part_path, 'ab' if offset else 'wb') as out_file:
+                        while True:
+                            chunk = response.read(1 << 20)
+                            if not chunk:
+                                break
+                            out_file.write(chunk)
+                            h.update(chunk)
                 
-                with urllib.request.urlopen(request) as response:
-                    with open(ptau_path, 'wb') as out_file:
-                        out_file.write(response.read())
+                size = part_path.stat().st_size
+                if expected is not None and size != offset + int(expected):
+                    raise Exception(f"Incomplete download ({size} bytes)")
                 
+                if h.hexdigest() != PTAU_BLAKE2B:
+                    part_path.unlink()
+                    raise Exception("Downloaded file does not match its published digest")
+                
+                part_path.replace(ptau_path)
                 print("✓ Downloaded Powers of Tau file")
                 return
                 
@@ -281,56 +462,184 @@ component main = RSASetupVerifier();
         print("2. Look for 'Powers of Tau' ceremony files")
         print("3. Download 'powersOfTau28_hez_final_14.ptau'")
         print(f"4. Place it in: {ptau_path.absolute()}")
-        print("\nOr use this smaller file for testing:")
-        print("https://www.dropbox.com/s/sample/pot12_final.ptau")
+        print(f"\nIts BLAKE2b digest must be {PTAU_BLAKE2B}")
         
         raise Exception("Could not download Powers of Tau file")
     
+    def _blake2b(self, path):
+        """BLAKE2b-512 of a file, read in chunks"""
+        h = hashlib.blake2b()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h
+    
     def compile_circuits(self):
         """Compile Circom circuits"""
+        if self._artifacts_current():
+            print("✓ Circuits unchanged, skipping compilation")
+            return
+        
         print("\nCompiling circuits...")
         
-        os.chdir("build")
+        # The outputs are about to change, so the old stamp no longer
+        # describes them; trusted_setup writes a new one once it finishes
+        (self.build / ".stamp.json").unlink(missing_ok=True)
+        
+        circuit = self.circuits / "rsa_verifier.circom"
         result = subprocess.run(
-            "circom ../circuits/rsa_verifier.circom --r1cs --wasm --sym",
-            shell=True,
+            ["circom", str(circuit), "--r1cs", "--wasm", "--c", "--sym"],
+            cwd=self.build,
             capture_output=True,
             text=True
         )
-        os.chdir("..")
         
         if result.returncode != 0:
             print(f"Error: {result.stderr}")
             raise Exception("Circuit compilation failed")
         
         print("✓ Circuits compiled successfully")
+        
+        # Build the native witness generator; generate_proof falls back
+        # to WASM when it is missing, so drop any binary from an older circuit
+        native_dir = self.build / "rsa_verifier_cpp"
+        (native_dir / "rsa_verifier").unlink(missing_ok=True)
+        
+        make = shutil.which("make")
+        if make:
+            result = subprocess.run(
+                [make, "-C", str(native_dir)],
+                capture_output=True,
+                text=True
+            )
+        
+        if make and result.returncode == 0:
+            print("✓ Native witness generator built")
+        else:
+            print("  Native witness generator build failed, using WASM")
     
     def trusted_setup(self):
         """Perform trusted setup"""
-        print("\nPerforming trusted setup...")
+        if self._artifacts_current():
+            print("✓ Circuits unchanged, skipping trusted setup")
+            return
         
-        os.chdir("build")
+        print("\nPerforming trusted setup...")
         
         # Groth16 setup
-        subprocess.run(
-            "snarkjs groth16 setup rsa_verifier.r1cs pot14_final.ptau circuit_0000.zkey",
-            shell=True
+        zkey = str(self.build / "circuit_0000.zkey")
+        self._snarkjs(
+            "zKey", "newZKey",
+            str(self.build / "rsa_verifier.r1cs"), str(self.build / "pot14_final.ptau"), zkey
         )
         
         # Export verification key
-        subprocess.run(
-            "snarkjs zkey export verificationkey circuit_0000.zkey verification_key.json",
-            shell=True
-        )
+        vkey = self._snarkjs("zKey", "exportVerificationKey", zkey)
+        with open(self.build / "verification_key.json", "w") as f:
+            json.dump(vkey, f)
+        
+        # Export the proving key once in bellman format for Rust consumers
+        # (bellman/arkworks), see verify_proof
+        self._snarkjs("zKey", "exportBellman", zkey, str(self.build / "circuit.params"))
+        
+        # Record what these artifacts were built from
+        with open(self.build / ".stamp.json", "w") as f:
+            json.dump({"key": self._artifact_key()}, f)
         
-        os.chdir("..")
         print("✓ Trusted setup complete")
     
+    def _load_verification_key(self):
+        """Parse the verification key once and keep it in the worker"""
+        with open(self.build / "verification_key.json", "r") as f:
+            self._vk = json.load(f)
+        
+        self._snarkjs_store("vk", self._vk)
+    
+    def _artifact_key(self):
+        """Hash of the circuit sources and the ptau file"""
+        h = hashlib.sha256()
+        for circuit in sorted(self.circuits.glob("*.circom")):
+            h.update(circuit.name.encode())
+            h.update(circuit.read_bytes())
+        
+        # download_ptau has already checked the ptau against this digest
+        h.update(PTAU_BLAKE2B.encode())
+        
+        return h.hexdigest()
+    
+    def _artifacts_current(self):
+        """Whether compiled circuits and keys match the current sources"""
+        outputs = [
+            "rsa_verifier.r1cs",
+            "rsa_verifier_js/rsa_verifier.wasm",
+            "circuit_0000.zkey",
+            "verification_key.json",
+            "circuit.params",
+        ]
+        if not all((self.build / name).exists() for name in outputs):
+            return False
+        
+        stamp_path = self.build / ".stamp.json"
+        if not stamp_path.exists():
+            return False
+        
+        with open(stamp_path, "r") as f:
+            stamp = json.load(f)
+        
+        return stamp.get("key") == self._artifact_key()
+    
     def generate_proof(self, p, q):
         """Generate a zero-knowledge proof"""
         print(f"\nGenerating proof for p={p}, q={q}...")
         
-        # Validate inputs
+        self._validate_inputs(p, q)
+        
+        # Generate witness
+        print("  Computing witness...")
+        self._compute_witness(p, q, "input.json", "witness.wtns")
+        
+        # Generate proof
+        print("  Generating proof...")
+        proof, public = self._prove("witness.wtns", "proof.json", "public.json")
+        
+        n = self._save_proof(proof, public, p, q, f"proof_{int(time.time())}")
+        
+        return proof, n
+    
+    def generate_proofs(self, pq_list):
+        """Generate proofs for several (p, q) pairs"""
+        # Witness generation for the next pair runs in the background
+        # while the current pair is being proved
+        print(f"\nGenerating {len(pq_list)} proofs...")
+        
+        for p, q in pq_list:
+            self._validate_inputs(p, q)
+        
+        batch_id = int(time.time())
+        results = []
+        
+        # Per-item file names keep the two stages from racing on the same files
+        def witness(i):
+            p, q = pq_list[i]
+            self._compute_witness(p, q, f"input_{i}.json", f"witness_{i}.wtns")
+        
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(witness, 0) if pq_list else None
+            
+            for i, (p, q) in enumerate(pq_list):
+                pending.result()
+                if i + 1 < len(pq_list):
+                    pending = pool.submit(witness, i + 1)
+                
+                print(f"  Proving p={p}, q={q}...")
+                proof, public = self._prove(f"witness_{i}.wtns", f"proof_{i}.json", f"public_{i}.json")
+                n = self._save_proof(proof, public, p, q, f"proof_{batch_id}_{i}")
+                results.append((proof, n))
+        
+        return results
+    
+    def _validate_inputs(self, p, q):
+        """Reject inputs the circuit cannot prove"""
         if not self._is_prime(p) or not self._is_prime(q):
             raise ValueError("Both p and q must be prime")
         if p == q:
@@ -339,104 +648,173 @@ component main = RSASetupVerifier();
             raise ValueError(f"p must be a {self.bit_length}-bit number")
         if not (self.min_value <= q <= self.max_value):
             raise ValueError(f"q must be a {self.bit_length}-bit number")
-        
-        # Create input file
+    
+    def _compute_witness(self, p, q, input_name, witness_name):
+        """Write the circuit input and compute its witness in the scratch dir"""
         input_data = {"p": str(p), "q": str(q)}
         
-        with open("build/input.json", "w") as f:
-            json.dump(input_data, f)
-        
-        os.chdir("build")
-        
-        # Generate witness
-        print("  Computing witness...")
-        subprocess.run(
-            "node rsa_verifier_js/generate_witness.js rsa_verifier_js/rsa_verifier.wasm input.json witness.wtns",
-            shell=True
-        )
-        
-        # Generate proof
-        print("  Generating proof...")
-        subprocess.run(
-            "snarkjs groth16 prove circuit_0000.zkey witness.wtns proof.json public.json",
-            shell=True
-        )
-        
-        # Read results
-        with open("proof.json", "r") as f:
-            proof = json.load(f)
+        input_path = self.scratch / input_name
+        witness_path = self.scratch / witness_name
         
-        with open("public.json", "r") as f:
-            public = json.load(f)
-        
-        os.chdir("..")
+        with open(input_path, "w") as f:
+            json.dump(input_data, f)
         
+        # The native generator is rebuilt with the circuit, so it goes first;
+        # a witnesscalc binary is only trusted if built after the last compile
+        native_witness = self.build / "rsa_verifier_cpp" / "rsa_verifier"
+        r1cs = self.build / "rsa_verifier.r1cs"
+        if native_witness.exists():
+            command = [str(native_witness), str(input_path), str(witness_path)]
+        elif self._witnesscalc and os.path.getmtime(self._witnesscalc) >= r1cs.stat().st_mtime:
+            command = [self._witnesscalc, str(input_path), str(witness_path)]
+        else:
+            js_dir = self.build / "rsa_verifier_js"
+            command = ["node", str(js_dir / "generate_witness.js"), str(js_dir / "rsa_verifier.wasm"),
+                       str(input_path), str(witness_path)]
+        
+        subprocess.run(command, cwd=self.scratch, check=True)
+    
+    def _prove(self, witness_name, proof_name, public_name):
+        """Prove a witness from the scratch dir and return (proof, public signals)"""
+        zkey = str(self.build / "circuit_0000.zkey")
+        witness_path = str(self.scratch / witness_name)
+        
+        if self._rapidsnark:
+            proof_path = self.scratch / proof_name
+            public_path = self.scratch / public_name
+            subprocess.run(
+                [self._rapidsnark, zkey, witness_path, str(proof_path), str(public_path)],
+                cwd=self.scratch,
+                check=True
+            )
+            
+            with open(proof_path, "r") as f:
+                proof = json.load(f)
+            
+            with open(public_path, "r") as f:
+                public = json.load(f)
+        else:
+            result = self._snarkjs("groth16", "prove", zkey, witness_path)
+            proof = result["proof"]
+            public = result["publicSignals"]
+        
+        return proof, public
+    
+    def _save_proof(self, proof, public, p, q, proof_id):
+        """Save a proof under proofs/ and return its public output n"""
         n = int(public[0])
-        proof_id = f"proof_{int(time.time())}"
         
-        # Save proof
-        with open(f"proofs/{proof_id}.json", "w") as f:
+        with open(self.proofs / f"{proof_id}.json", "w") as f:
             json.dump({"proof": proof, "public": public, "p": p, "q": q}, f)
         
         print(f"✓ Proof generated successfully")
         print(f"  Public output: n = {n}")
         print(f"  Proof saved as: {proof_id}.json")
         
-        return proof, n
+        return n
     
     def verify_proof(self, proof, n):
         """Verify a proof"""
+        # Rust verifiers reading build/circuit.params should deserialize it
+        # with the *_unchecked loaders (e.g. G1Affine::new_unchecked): the
+        # points come from our own trusted setup, and per-point curve and
+        # subgroup checks dominate load time otherwise
         print(f"\nVerifying proof for n={n}...")
         
-        # Prepare files
-        with open("build/proof_to_verify.json", "w") as f:
-            json.dump(proof, f)
-        
-        with open("build/public_to_verify.json", "w") as f:
-            json.dump([str(n)], f)
-        
-        os.chdir("build")
-        
-        # Verify proof
-        result = subprocess.run(
-            "snarkjs groth16 verify verification_key.json public_to_verify.json proof_to_verify.json",
-            shell=True,
-            capture_output=True,
-            text=True
+        # Verify proof, passing the proof and public signals inline
+        verified = self._snarkjs(
+            "groth16", "verify",
+            {"$ref": "vk"},
+            [str(n)],
+            proof
         )
         
-        os.chdir("..")
-        
-        verified = "OK!" in result.stdout
         print(f"✓ Verification result: {'VALID' if verified else 'INVALID'}")
         
         return verified
     
     def _is_prime(self, n):
-        """Simple primality test"""
+        """Primality test: sieve lookup, gmpy2, or Miller-Rabin (exact below 3.3e24)"""
         if n < 2:
             return False
-        if n == 2:
-            return True
-        if n % 2 == 0:
-            return False
-        
-        for i in range(3, int(n**0.5) + 1, 2):
-            if n % i == 0:
+        if self._sieve is not None and n < len(self._sieve):
+            return bool(self._sieve[n])
+        
+        # GMP's C implementation is much faster for large bit_length
+        if gmpy2 is not None:
+            return bool(gmpy2.is_prime(n))
+        
+        for p in SMALL_PRIMES:
+            if n % p == 0:
+                return n == p
+        
+        # Write n - 1 = d * 2^s with d odd
+        d = n - 1
+        s = 0
+        while d % 2 == 0:
+            d //= 2
+            s += 1
+        
+        # Bases {2, 7, 61} are exact below 4759123141 and the first thirteen
+        # primes (2..41) below 3317044064679887385961981. No finite base set
+        # is known to be exact above that, so larger n get a probabilistic
+        # answer from all of SMALL_PRIMES
+        if n < 4759123141:
+            bases = (2, 7, 61)
+        elif n < 3317044064679887385961981:
+            bases = SMALL_PRIMES[:13]
+        else:
+            bases = SMALL_PRIMES
+        
+        for a in bases:
+            x = pow(a, d, n)
+            if x == 1 or x == n - 1:
+                continue
+            for _ in range(s - 1):
+                x = pow(x, 2, n)
+                if x == n - 1:
+                    break
+            else:
                 return False
         return True
     
+    def _prime_sieve(self):
+        """Sieve of Eratosthenes over [0, min(max_value + 1, SIEVE_LIMIT)), built once"""
+        if self._sieve is None:
+            size = min(self.max_value + 1, SIEVE_LIMIT)
+            if np is not None:
+                sieve = np.ones(size, dtype=bool)
+                sieve[:2] = False
+                for p in range(2, math.isqrt(size - 1) + 1):
+                    if sieve[p]:
+                        sieve[p*p::p] = False
+            else:
+                sieve = bytearray(b'\x01') * size
+                sieve[:2] = b'\x00\x00'
+                for p in range(2, math.isqrt(size - 1) + 1):
+                    if sieve[p]:
+                        sieve[p*p::p] = bytes(len(range(p*p, size, p)))
+            self._sieve = sieve
+        return self._sieve
+    
     def find_16bit_primes(self, count=10):
         """Find some 16-bit primes for testing"""
-        primes = []
-        n = self.min_value
-        
-        while len(primes) < count and n <= self.max_value:
-            if self._is_prime(n):
-                primes.append(n)
-            n += 2 if n > 2 else 1
-        
-        return primes
+        if self.max_value >= SIEVE_LIMIT:
+            # Too wide to sieve, so test odd candidates one at a time
+            primes = []
+            for n in range(self.min_value | 1, self.max_value + 1, 2):
+                if self._is_prime(n):
+                    primes.append(n)
+                    if len(primes) == count:
+                        break
+            return primes
+        
+        sieve = self._prime_sieve()
+        if np is not None:
+            primes = np.nonzero(sieve[self.min_value:self.max_value + 1])[0] + self.min_value
+            return primes[:count].tolist()
+        primes = [i for i in range(self.min_value, self.max_value + 1) if sieve[i]]
+        return primes[:count]
 
 
 def run_demo():
@@ -448,56 +826,59 @@ def run_demo():
     # Initialize
     verifier = ZKRSAVerifier(bit_length=16)
     
-    # Find test primes
-    print("\nFinding 16-bit primes...")
-    primes = verifier.find_16bit_primes(10)
-    print(f"Found primes: {primes[:5]}...")
-    
-    # Test 1: Valid proof
-    print("\n" + "-"*60)
-    print("TEST 1: Valid RSA Setup")
-    print("-"*60)
-    
-    p = primes[0]  # First prime
-    q = primes[1]  # Second prime
-    
-    print(f"Secret inputs:")
-    print(f"  p = {p}")
-    print(f"  q = {q}")
-    print(f"Expected output: n = {p * q}")
-    
-    # Generate proof
-    proof, n = verifier.generate_proof(p, q)
-    
-    # Verify proof
-    is_valid = verifier.verify_proof(proof, n)
-    
-    # Test 2: Wrong n
-    print("\n" + "-"*60)
-    print("TEST 2: Verification with Wrong n")
-    print("-"*60)
-    
-    wrong_n = n + 1
-    is_valid_wrong = verifier.verify_proof(proof, wrong_n)
-    
-    # Test 3: Invalid inputs
-    print("\n" + "-"*60)
-    print("TEST 3: Invalid Inputs")
-    print("-"*60)
-    
     try:
-        # Non-prime
-        print("Trying with non-prime (32770)...")
-        verifier.generate_proof(32770, primes[0])
-    except ValueError as e:
-        print(f"✓ Correctly rejected: {e}")
-    
-    try:
-        # Same values
-        print("Trying with p = q...")
-        verifier.generate_proof(primes[0], primes[0])
-    except ValueError as e:
-        print(f"✓ Correctly rejected: {e}")
+        # Find test primes
+        print("\nFinding 16-bit primes...")
+        primes = verifier.find_16bit_primes(10)
+        print(f"Found primes: {primes[:5]}...")
+        
+        # Test 1: Valid proof
+        print("\n" + "-"*60)
+        print("TEST 1: Valid RSA Setup")
+        print("-"*60)
+        
+        p = primes[0]  # First prime
+        q = primes[1]  # Second prime
+        
+        print(f"Secret inputs:")
+        print(f"  p = {p}")
+        print(f"  q = {q}")
+        print(f"Expected output: n = {p * q}")
+        
+        # Generate proof
+        proof, n = verifier.generate_proof(p, q)
+        
+        # Verify proof
+        is_valid = verifier.verify_proof(proof, n)
+        
+        # Test 2: Wrong n
+        print("\n" + "-"*60)
+        print("TEST 2: Verification with Wrong n")
+        print("-"*60)
+        
+        wrong_n = n + 1
+        is_valid_wrong = verifier.verify_proof(proof, wrong_n)
+        
+        # Test 3: Invalid inputs
+        print("\n" + "-"*60)
+        print("TEST 3: Invalid Inputs")
+        print("-"*60)
+        
+        try:
+            # Non-prime
+            print("Trying with non-prime (32770)...")
+            verifier.generate_proof(32770, primes[0])
+        except ValueError as e:
+            print(f"✓ Correctly rejected: {e}")
+        
+        try:
+            # Same values
+            print("Trying with p = q...")
+            verifier.generate_proof(primes[0], primes[0])
+        except ValueError as e:
+            print(f"✓ Correctly rejected: {e}")
+    finally:
+        verifier.close()
     
     # Summary
     print("\n" + "="*60)